@@ -4,6 +4,7 @@ MetricsOutput.xlsx file that does the following changes
 
 Changes:
     - from rows 16-19, move data 2 cells to the right from column B
+      (done while converting the .tsv, so the sheet is only read once)
     - from row 17, higlight in red any cell that says FALSE
     - set a variable for threshold cells in columns B and C
         - [DNA Library QC Metrics] 23-24
@@ -17,11 +18,9 @@ Changes:
 
 import argparse
 import csv
-from os import remove
+import numpy as np
 import openpyxl
-import pandas as pd
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill, Font
+from openpyxl.styles import PatternFill, Font, NamedStyle
 
 
 class Excel():
@@ -35,6 +34,38 @@ class Excel():
     # Set a characteristics for highlighted columns
     RED_TEXT = Font(name='Calibri', color="9C0006")
     RED_FILL = PatternFill(patternType="solid", start_color="FFC7CE")
+    # Name of the registered style applied to every highlighted cell
+    RED_STYLE = 'red_qc'
+
+    # Metrics compared individually against their LSL/USL guidelines
+    METRICS_TO_FIND = ['MEDIAN_INSERT_SIZE (bp)',
+                       'MEDIAN_EXON_COVERAGE (Count)',
+                       'PCT_EXON_50X (%)',
+                       'USABLE_MSI_SITES (Count)',
+                       'COVERAGE_MAD (Count)',
+                       'MEDIAN_BIN_COUNT_CNV_TARGET (Count)',
+                       'MEDIAN_CV_GENE_500X (%)',
+                       'TOTAL_ON_TARGET_READS (Count)',
+                       'MEDIAN_INSERT_SIZE (Count)']
+
+    @staticmethod
+    def to_float_array(values):
+        """
+        Convert a sequence of cell values to a numpy float array
+
+        Parameters
+        ----------
+        values : sequence
+            Cell values, either numbers or strings such as 'NA'
+
+        Returns
+        -------
+        numpy.ndarray
+            Float array where any non-numeric value is NaN
+
+        """
+        return np.array([value if isinstance(value, (int, float)) else np.nan
+                         for value in values], dtype=float)
 
     # Set highlight cell function
     def highlight_cell(self, xl_col, xl_row):
@@ -43,8 +74,8 @@ class Excel():
 
         Parameters
         ----------
-        xl_col : string
-            Excel column e.g. 'A'
+        xl_col : int
+            Excel column (1 based columns)
         xl_row : int
             Excel row (1 based rows)
 
@@ -53,161 +84,184 @@ class Excel():
         None.
 
         """
-        self.ws[f'{xl_col}{xl_row}'].fill = Excel.RED_FILL
-        self.ws[f'{xl_col}{xl_row}'].font = Excel.RED_TEXT
+        self.ws.cell(row=xl_row, column=xl_col).style = Excel.RED_STYLE
 
-    def __init__(self, file) -> None:
+    def __init__(self, workbook, file) -> None:
         print(f"Editing excel file {file}")
-        # String with excel filename
+        # String with excel filename to write the output to
         self.file = file
-        # Workbook of excel file
-        self.wb = openpyxl.load_workbook(self.file)
+        # Workbook converted from the .tsv file
+        self.wb = workbook
         # Worksheet of interest from excel file
         self.ws = self.wb['Sheet']
         # Change the worksheet name to MetricsOutput
         self.ws.title = "MetricsOutput"
-        # Set a pandas dataframe which reflects the contents of the worksheet
-        self.df = pd.DataFrame(self.ws.values)
+        # Keep a plain 2D list which reflects the contents of the worksheet
+        self.rows = list(self.ws.iter_rows(values_only=True))
+        # Index the metric rows in a single sweep of the first column
+        self.index_metric_rows()
+        # Register the highlight style once so every flagged cell only
+        # needs a single style assignment
+        self.wb.add_named_style(NamedStyle(name=Excel.RED_STYLE,
+                                           font=Excel.RED_TEXT,
+                                           fill=Excel.RED_FILL))
 
     def modify(self) -> None:
         """
         Calls all methods in excel() to modify and generate output file
         with desired changes
         """
-        self.move_rows()
-        self.mark_false()
-        self.mark_contamination_metrics()
-        self.mark_other_metrics()
+        # Fail fast on invalid data before any cell is modified
+        self.validate_false_placement()
+
+        cells_to_highlight = set()
+        cells_to_highlight |= self.find_false_cells()
+        cells_to_highlight |= self.find_contamination_cells()
+        cells_to_highlight |= self.find_other_metric_cells()
+
+        # Apply the highlight style to every collected cell in one pass
+        for xl_col, xl_row in cells_to_highlight:
+            self.highlight_cell(xl_col, xl_row)
+
         self.wb.save(self.file)
         print(f"Done! {self.file} file generated")
 
-    def move_rows(self) -> None:
+    def index_metric_rows(self) -> None:
         """
-        Excel method which modifies its input by moving the set of rows
-        from 16 to 19 by 2 columns towards the right.
+        Build a dictionary mapping every metric name from the first
+        column to its row index in the worksheet contents.
 
-        This is to shift the [Analysis status] table to allign sample metrics
-        with the rest of the tables from the excel file.
+        This allows the marking methods to find a metric row with a
+        single dictionary lookup instead of re-scanning the whole
+        worksheet for every sample and metric combination.
         """
-        # Obtain the last column letter of the excel file and store it
-        # in a variable
-        max_column = get_column_letter(self.ws.max_column - 2)
+        self._metric_rows = {}
+        for row_index, row in enumerate(self.rows):
+            value = row[0]
+            if value is not None and value not in self._metric_rows:
+                self._metric_rows[value] = row_index
+
+        # Precompute the rows and the LSL/USL guidelines of the metrics
+        # present in the worksheet as float vectors, with NaN standing
+        # in for 'NA', ready for the numpy threshold comparison
+        self._other_metric_rows = [self._metric_rows[metric]
+                                   for metric in Excel.METRICS_TO_FIND
+                                   if metric in self._metric_rows]
+        self._other_metric_LSL = self.to_float_array(
+            [self.rows[row][1] for row in self._other_metric_rows])
+        self._other_metric_USL = self.to_float_array(
+            [self.rows[row][2] for row in self._other_metric_rows])
+
+    def validate_false_placement(self) -> None:
+        """
+        Ensure no cell outside row 17 contains the string FALSE.
 
-        self.ws.move_range(f'B16:{max_column}19', cols=2)
-        self.df = pd.DataFrame(self.ws.values)
+        Raises
+        ------
+        TypeError
+            If a FALSE string is found outside of row 17
 
-    def mark_false(self) -> None:
         """
-        Mark in red all cells with string FALSE.
-        An error will be raised if the string is found outside of row 17
+        for row_index, row in enumerate(self.rows):
+            if row_index != 16 and "FALSE" in row:
+                raise TypeError("FALSE string found outside expected row.")
 
+    def find_false_cells(self) -> set:
         """
-        # store a list of cell indices where the contain a string equal to
-        # "FALSE"
-        false_cells_indices = self.df.stack().index[self.df.stack() ==
-                                                    "FALSE"]
-        # Mark every cell from the list in red
-        for idx in false_cells_indices:
-            xl_row = idx[0]+1
-            if xl_row != 17:
-                remove(self.file)
-                raise TypeError("FALSE string found outside expected row.")
-            xl_col = get_column_letter(idx[1]+1)
-            self.highlight_cell(xl_col, xl_row)
+        Find all cells from row 17 with string FALSE to mark in red
+
+        Returns
+        -------
+        set
+            (column, row) excel indices of the cells to highlight
 
-    def mark_contamination_metrics(self) -> None:
         """
-        Mark in red the DNA Library QC metrics when values
+        if len(self.rows) < 17:
+            return set()
+
+        # Collect every "FALSE" cell from row 17
+        return {(col_index+1, 17)
+                for col_index, value in enumerate(self.rows[16])
+                if value == "FALSE"}
+
+    def find_contamination_cells(self) -> set:
+        """
+        Find the DNA Library QC metric cells to mark in red when values
         exceed the guidelines on all metrics from the elements_to_find list
+
+        Returns
+        -------
+        set
+            (column, row) excel indices of the cells to highlight
+
         """
         elements_to_find = ["CONTAMINATION_SCORE (NA)",
                             "CONTAMINATION_P_VALUE (NA)"]
 
-        # Set a loop for each sample
-        for sample_col_index in range(3, len(self.df.columns)):
-            # Set loop for each metric
-            for element in elements_to_find:
-                indices = self.df.stack().index[self.df.stack() == element]
-                for idx in indices:
-                    row = idx[0]
-                    first_column = idx[1]
-                    LSL_column_index = first_column + 1
-                    USL_column_index = first_column + 2
-
-                    value_to_compare = self.df.loc[row][sample_col_index]
-
-                    # Ensure that each string from the elements_to_find are
-                    # found in the first column
-                    if first_column == 0:
-                        LSL = self.df.loc[row][LSL_column_index]
-                        USL = self.df.loc[row][USL_column_index]
-
-                # Store a boolean for each sample and set to false when any
-                # metric does not exceed the USL and LSL thresholds
-                if value_to_compare == 'NA':
-                    sample_to_highlight = False
-                elif value_to_compare < LSL or value_to_compare > USL:
-                    sample_to_highlight = True
-                else:
-                    sample_to_highlight = False
-                    break
-
-            # If boolean remains true, highlight every value for sample
-            if sample_to_highlight is True:
-                for element in elements_to_find:
-                    indices = self.df.stack().index[self.df.stack() == element]
-                    for idx in indices:
-                        xl_row = idx[0]+1
-                        xl_col = get_column_letter(sample_col_index+1)
-                        self.highlight_cell(xl_col, xl_row)
-
-    def mark_other_metrics(self):
+        # Look up the row of every contamination metric present in the
+        # worksheet
+        element_rows = [self._metric_rows[element]
+                        for element in elements_to_find
+                        if element in self._metric_rows]
+
+        if not element_rows:
+            return set()
+
+        # Extract the sample values and the LSL/USL guidelines of the
+        # contamination rows as float blocks, with NaN standing in
+        # for 'NA'
+        sample_values = np.array([self.to_float_array(self.rows[row][3:])
+                                  for row in element_rows])
+        LSL = self.to_float_array([self.rows[row][1] for row in element_rows])
+        USL = self.to_float_array([self.rows[row][2] for row in element_rows])
+
+        # Flag every value outside its LSL/USL guidelines; comparisons
+        # against NaN are always False, so 'NA' values never count as
+        # outside
+        outside = ((sample_values < LSL.reshape(-1, 1)) |
+                   (sample_values > USL.reshape(-1, 1)))
+
+        # Collect the samples where every contamination metric exceeds
+        # its guidelines
+        sample_cols = np.flatnonzero(outside.all(axis=0)) + 3
+
+        return {(int(sample_col)+1, row+1)
+                for sample_col in sample_cols for row in element_rows}
+
+    def find_other_metric_cells(self) -> set:
         """
-        Mark in red the DNA Library QC metrics when
+        Find the DNA Library QC metric cells to mark in red when
         values exceed the guidelines
-        """
 
-        metrics_to_find = ['MEDIAN_INSERT_SIZE (bp)',
-                           'MEDIAN_EXON_COVERAGE (Count)',
-                           'PCT_EXON_50X (%)',
-                           'USABLE_MSI_SITES (Count)',
-                           'COVERAGE_MAD (Count)',
-                           'MEDIAN_BIN_COUNT_CNV_TARGET (Count)',
-                           'MEDIAN_CV_GENE_500X (%)',
-                           'TOTAL_ON_TARGET_READS (Count)',
-                           'MEDIAN_INSERT_SIZE (Count)']
-
-        # Set a loop for each sample
-        for sample_col_index in range(3, len(self.df.columns)):
-            # Search for the cell location for every metric from metrics list
-            for metric in metrics_to_find:
-                indices = self.df.stack().index[self.df.stack() == metric]
-                # Once cell found, assign variables to USL and LSL guidelines
-                for idx in indices:
-                    row = idx[0]
-                    LSL = self.df.loc[row][idx[1]+1]
-                    USL = self.df.loc[row][idx[1]+2]
-                    sample_value = self.df.loc[row][sample_col_index]
-
-                    # Highlight cells if sample value is outside LSL and USL
-                    if LSL == 'NA' and USL == 'NA':
-                        pass
-                    elif LSL == 'NA' and sample_value != 'NA':
-                        if sample_value > USL:
-                            xl_row = idx[0]+1
-                            xl_col = get_column_letter(sample_col_index+1)
-                            self.highlight_cell(xl_col, xl_row)
-                    elif USL == 'NA' and sample_value != 'NA':
-                        if sample_value < LSL:
-                            xl_row = idx[0]+1
-                            xl_col = get_column_letter(sample_col_index+1)
-                            self.highlight_cell(xl_col, xl_row)
-                    else:
-                        if sample_value != 'NA':
-                            if sample_value < LSL or sample_value > USL:
-                                xl_row = idx[0]+1
-                                xl_col = get_column_letter(sample_col_index+1)
-                                self.highlight_cell(xl_col, xl_row)
+        Returns
+        -------
+        set
+            (column, row) excel indices of the cells to highlight
+
+        """
+        # Use the rows and LSL/USL guideline vectors precomputed by
+        # index_metric_rows
+        metric_rows = self._other_metric_rows
+        if not metric_rows:
+            return set()
+        LSL = self._other_metric_LSL
+        USL = self._other_metric_USL
+
+        # Extract the sample values for all metric rows at once, turning
+        # 'NA' strings into NaN so the whole block can be compared in a
+        # single numpy pass
+        sample_values = np.array(
+            [self.to_float_array(self.rows[row][3:]) for row in metric_rows])
+
+        # Flag every value outside its LSL/USL guidelines; comparisons
+        # against NaN are always False, so 'NA' values and 'NA'
+        # guidelines never trigger a highlight
+        outside = ((sample_values < LSL.reshape(-1, 1)) |
+                   (sample_values > USL.reshape(-1, 1)))
+
+        # Collect only the flagged cells
+        return {(int(sample_index)+4, metric_rows[metric_index]+1)
+                for metric_index, sample_index in np.argwhere(outside)}
 
 
 def parse_args() -> argparse.Namespace:
@@ -232,14 +286,41 @@ def parse_args() -> argparse.Namespace:
     return args
 
 
-def tsv_to_excel(input_filepath, output_filepath):
+def convert_value(item):
+    """
+    Convert a single .tsv field to a number where possible.
+
+    Args:
+        item (str)
+
+    Returns:
+        int, float or str of the given field
+    """
+    try:
+        # Most numeric fields are whole numbers, so try int first
+        return int(item)
+    except ValueError:
+        try:
+            # Convert to float if int not possible
+            return float(item)
+        except ValueError:
+            # If no conversions work, item is treated as str
+            return item
+
+
+def tsv_to_excel(input_filepath):
     """
-    Function which creates an excel file from a .tsv file.
+    Function which creates an excel workbook from a .tsv file.
+
+    Rows 16 to 19 are shifted two columns to the right from column B,
+    so the [Analysis Status] table alligns with the sample columns of
+    the other tables from the excel file.
 
     Args:
         input_filepath (str)
-        output_filepath (str)
 
+    Returns:
+        openpyxl.Workbook of the .tsv file contents
     """
     workbook_object = openpyxl.Workbook()
     worksheet = workbook_object.active
@@ -247,22 +328,15 @@ def tsv_to_excel(input_filepath, output_filepath):
     # Convert .tsv file to excel
     with open(input_filepath, 'r', encoding='UTF-8') as csvfile:
         read_tsv = csv.reader(csvfile, delimiter='\t')
-        for row in read_tsv:
-            converted_row = []
-            for item in row:
-                try:
-                    # Convert to float if possible
-                    converted_row.append(float(item))
-                except ValueError:
-                    try:
-                        # Convert to int if float not possible
-                        converted_row.append(int(item))
-                    except ValueError:
-                        # If no exceptions work, item is treated as str
-                        converted_row.append(item)
+        for row_number, row in enumerate(read_tsv, start=1):
+            converted_row = [convert_value(item) for item in row]
+            # Shift the [Analysis Status] table while the rows are
+            # appended, rather than moving cells afterwards
+            if 16 <= row_number <= 19:
+                converted_row[1:1] = [None, None]
             worksheet.append(converted_row)
 
-    workbook_object.save(output_filepath)
+    return workbook_object
 
 
 def main():
@@ -272,9 +346,9 @@ def main():
     """
     args = parse_args()
 
-    tsv_to_excel(args.tsv_input, args.output_filename)
+    workbook = tsv_to_excel(args.tsv_input)
 
-    excel_file = Excel(args.output_filename)
+    excel_file = Excel(workbook, args.output_filename)
     excel_file.modify()
 
     print(args.tsv_input)